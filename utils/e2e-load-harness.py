@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import requests
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+STATS_TIMEOUT = 10
+
+
+def _free_port():
+  """Ask the OS for a free local TCP port."""
+  with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+
+def _generate_certificate(work_dir):
+  """Create a self-signed `localhost` certificate, since the scripts always talk HTTPS."""
+  certfile, keyfile = f'{work_dir}/fake-peertube-cert.pem', f'{work_dir}/fake-peertube-key.pem'
+  try:
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1',
+                    '-keyout', keyfile, '-out', certfile], check=True, capture_output=True, text=True)
+  except FileNotFoundError:
+    click.echo(click.style("Error: `openssl` is required to generate the fake server's certificate.", fg='red'))
+    exit(1)
+  except subprocess.CalledProcessError as e:
+    click.echo(click.style(f"Error: `openssl` failed with code {e.returncode}: {e.stderr.strip()}", fg='red'))
+    exit(1)
+  return certfile, keyfile
+
+
+def _wait_for_server(base_url, certfile, server, timeout=10.0):
+  """Poll the fake server's stats endpoint until it answers."""
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    if server.poll() is not None:
+      click.echo(click.style(f"Fake PeerTube server exited with code {server.returncode}.", fg='red'))
+      exit(1)
+    try:
+      requests.get(f'{base_url}/_fake/stats', verify=certfile, timeout=1).raise_for_status()
+      return
+    except requests.exceptions.RequestException:
+      time.sleep(0.1)
+  click.echo(click.style(f"Fake PeerTube server did not come up at {base_url} within {timeout:.0f} sec.", fg='red'))
+  exit(1)
+
+
+def _fake_control(method, base_url, path, certfile):
+  """Call one of the fake server's `/_fake/...` control endpoints, exiting if it does not answer."""
+  try:
+    response = requests.request(method, f'{base_url}{path}', verify=certfile, timeout=STATS_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+  except requests.exceptions.RequestException as e:
+    click.echo(click.style(f"Error: Fake PeerTube server did not answer {method} {path}: {e}", fg='red'))
+    exit(1)
+
+
+def _skip_step(name, reason):
+  """Record a script that was not run because an earlier step did not produce its input."""
+  click.echo(click.style(f"{name.ljust(28)} | skipped, {reason}", fg='yellow'))
+  return {
+    'script': name,
+    'skipped': True,
+    'exit_code': None,
+    'wall_time': 0.0,
+    'requests': 0,
+    'requests_per_sec': 0.0,
+    'throttled': 0,
+    'injected_errors': 0,
+    'retries': 0,
+    'by_status': {},
+    'by_endpoint': {}
+  }
+
+
+def _run_step(python, name, args, base_url, certfile, work_dir, env):
+  """Run one utility script against the fake server and collect wall time and request statistics."""
+  _fake_control('POST', base_url, '/_fake/reset', certfile)
+  started_at = time.monotonic()
+  result = subprocess.run([python, f'{UTILS_DIR}/{name}', *args], cwd=work_dir, env=env,
+                          capture_output=True, text=True)
+  wall_time = time.monotonic() - started_at
+  stats = _fake_control('GET', base_url, '/_fake/stats', certfile)
+  step = {
+    'script': name,
+    'skipped': False,
+    'exit_code': result.returncode,
+    'wall_time': wall_time,
+    'requests': stats['requests'],
+    'requests_per_sec': stats['requests'] / wall_time if wall_time else 0.0,
+    'throttled': stats['throttled'],
+    'injected_errors': stats['injected_errors'],
+    'retries': stats['retries'],
+    'by_status': stats['by_status'],
+    'by_endpoint': stats['by_endpoint']
+  }
+  colour = 'green' if result.returncode == 0 else 'red'
+  click.echo(click.style(f"{name.ljust(28)} | exit {result.returncode} | {wall_time:7.2f} sec | "
+                         f"{stats['requests']:6d} requests | {step['requests_per_sec']:8.1f} req/s | "
+                         f"429: {stats['throttled']:5d} | 500: {stats['injected_errors']:5d} | "
+                         f"retries: {stats['retries']:5d}", fg=colour))
+  if result.returncode != 0:
+    click.echo(click.style(result.stderr.strip() or result.stdout.strip()[-2000:], fg='red'))
+  return step, result
+
+
+def _run_scripts(python, work_dir, server_args):
+  """Start the fake server in `work_dir` and run each utility script against it, returning the step results."""
+  certfile, keyfile = _generate_certificate(work_dir)
+  port = _free_port()
+  hostname = f'localhost:{port}'
+  base_url = f'https://{hostname}'
+  # Faults are only injected into the measured scripts, not into issuing their auth token
+  server = subprocess.Popen([sys.executable, f'{UTILS_DIR}/fake-peertube-server.py', '--port', str(port),
+                             *server_args, '--exempt-oauth', '--certfile', certfile, '--keyfile', keyfile])
+
+  # The scripts are run unmodified, so trust the self-signed certificate and give `git` an identity
+  env = dict(os.environ,
+             REQUESTS_CA_BUNDLE=certfile,
+             GIT_AUTHOR_NAME='e2e-load-harness', GIT_AUTHOR_EMAIL='e2e-load-harness@localhost',
+             GIT_COMMITTER_NAME='e2e-load-harness', GIT_COMMITTER_EMAIL='e2e-load-harness@localhost')
+  steps = []
+  try:
+    _wait_for_server(base_url, certfile, server)
+
+    step, _ = _run_step(python, 'issue-auth-token.py', [hostname, 'e2e-user', 'e2e-password'],
+                        base_url, certfile, work_dir, env)
+    steps.append(step)
+    token_file_path = f'{work_dir}/data/auth-bearer-token.json'
+    if not os.path.exists(token_file_path):
+      steps.extend(_skip_step(name, 'no auth token issued') for name in
+                   ['build-video-inventory.py', 'slow-jobs-scheduling.py', 'archive-video-metadata.py'])
+      return steps
+    with open(token_file_path, 'r') as auth_token_file:
+      bearer_token = json.load(auth_token_file)['access_token']
+
+    step, _ = _run_step(python, 'build-video-inventory.py', [hostname, bearer_token],
+                        base_url, certfile, work_dir, env)
+    steps.append(step)
+    if not os.path.exists(f'{work_dir}/data/video-inventory-by-subtitles.json'):
+      steps.extend(_skip_step(name, 'no video inventory built') for name in
+                   ['slow-jobs-scheduling.py', 'archive-video-metadata.py'])
+      return steps
+    for name, args in [
+      ('slow-jobs-scheduling.py', [hostname, bearer_token]),
+      ('archive-video-metadata.py', [hostname, bearer_token, 'data/peertube-captions'])
+    ]:
+      step, _ = _run_step(python, name, args, base_url, certfile, work_dir, env)
+      steps.append(step)
+  finally:
+    server.terminate()
+    server.wait()
+  return steps
+
+
+@click.command()
+@click.option('--videos', default=500, show_default=True, help='Number of videos in the fake catalogue.')
+@click.option('--captioned-ratio', default=0.5, show_default=True, help='Share of videos that already have captions.')
+@click.option('--active-jobs', default=2, show_default=True, help='Number of runner jobs already processing.')
+@click.option('--latency', default=0.0, show_default=True,
+              help='Added latency per API request not answered with HTTP 429 or 500, in seconds.')
+@click.option('--error-rate', default=0.0, show_default=True, help='Share of API requests failing with HTTP 500.')
+@click.option('--rate-limit', default=0, show_default=True,
+              help='Max API requests per second before answering HTTP 429, 0 to disable.')
+@click.option('--seed', default=0, show_default=True, help='Random seed for the catalogue and error injection.')
+@click.option('--work-dir', default=None,
+              help='Directory for the scripts\' `data/` output, a temporary one removed afterwards if unset.')
+@click.option('--python', default=sys.executable, show_default=True,
+              help='Python interpreter running the scripts, with `click`, `requests` and `sh` installed.')
+@click.option('--report', default=None, help='Write the measurements as JSON to this path.')
+def e2e_load_harness(videos, captioned_ratio, active_jobs, latency, error_rate, rate_limit, seed, work_dir, python,
+                     report):
+  """Run the network-bound utility scripts end-to-end against a local fake PeerTube server and measure them."""
+
+  if report:
+    report = os.path.abspath(report)
+    os.makedirs(os.path.dirname(report), exist_ok=True)
+    if not os.access(os.path.dirname(report), os.W_OK):
+      click.echo(click.style(f"Error: Cannot write the report to {report}.", fg='red'))
+      exit(1)
+
+  temporary_work_dir = work_dir is None
+  work_dir = os.path.abspath(work_dir or tempfile.mkdtemp(prefix='peertube-e2e-'))
+  if os.path.isdir(f'{work_dir}/data') and os.listdir(f'{work_dir}/data'):
+    click.echo(click.style(f"Work dir {work_dir}/data is not empty, the scripts would reuse its inventories and "
+                           f"archive instead of doing a full run. Remove it or pick another --work-dir.", fg='red'))
+    exit(1)
+  os.makedirs(f'{work_dir}/data', exist_ok=True)
+  click.echo(click.style(f"Running end-to-end load harness in {work_dir}.", fg='green'))
+
+  server_args = ['--videos', str(videos), '--captioned-ratio', str(captioned_ratio),
+                 '--active-jobs', str(active_jobs), '--latency', str(latency),
+                 '--error-rate', str(error_rate), '--rate-limit', str(rate_limit), '--seed', str(seed)]
+  try:
+    steps = _run_scripts(python, work_dir, server_args)
+  finally:
+    if temporary_work_dir:
+      shutil.rmtree(work_dir, ignore_errors=True)
+      click.echo(click.style(f"Removed temporary work dir {work_dir}.", fg='green'))
+
+  total_requests = sum(step['requests'] for step in steps)
+  total_wall_time = sum(step['wall_time'] for step in steps)
+  click.echo(click.style(f"Total: {total_requests} requests in {total_wall_time:.2f} sec "
+                         f"({total_requests / total_wall_time if total_wall_time else 0.0:.1f} req/s), "
+                         f"{sum(step['throttled'] for step in steps)} throttled, "
+                         f"{sum(step['injected_errors'] for step in steps)} injected errors, "
+                         f"{sum(step['retries'] for step in steps)} retries, "
+                         f"{sum(step['skipped'] for step in steps)} scripts skipped.", fg='green'))
+  if report:
+    with open(report, 'w') as report_file:
+      report_file.write(json.dumps({
+        'settings': {
+          'videos': videos,
+          'captioned_ratio': captioned_ratio,
+          'active_jobs': active_jobs,
+          'latency': latency,
+          'error_rate': error_rate,
+          'rate_limit': rate_limit,
+          'seed': seed
+        },
+        'steps': steps,
+        'total_requests': total_requests,
+        'total_wall_time': total_wall_time
+      }, indent=2))
+    click.echo(click.style(f"Report written to {report}.", fg='green'))
+  if any(step['exit_code'] not in (0, None) for step in steps):
+    exit(1)
+
+
+if __name__ == '__main__':
+  e2e_load_harness()
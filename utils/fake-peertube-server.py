@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+import json
+import random
+import ssl
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import click
+
+CAPTION_PATH_PREFIX = '/lazy-static/video-captions/'
+JOB_STATES = {1: 'Pending', 2: 'Processing', 3: 'Completed', 4: 'Errored'}
+
+
+def _iso(moment):
+  """Format a datetime the way the PeerTube API does, e.g. `2024-05-01T12:00:00.000Z`."""
+  return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}Z'
+
+
+class FakePeerTube:
+  """In-memory PeerTube state: video catalogue, captions, runner jobs and request statistics."""
+
+  def __init__(self, videos, captioned_ratio, active_jobs, latency, error_rate, rate_limit, seed, exempt_oauth):
+    self.latency = latency
+    self.error_rate = error_rate
+    self.rate_limit = rate_limit
+    self.exempt_oauth = exempt_oauth
+    self.lock = threading.Lock()
+    self.random = random.Random(seed)
+    self.videos = []
+    self.videos_by_uuid = {}
+    self.captions = {}
+    self.jobs = []
+    self.recent_requests = deque()
+    self._reset_stats()
+
+    published_at = datetime(2020, 1, 1, 12, tzinfo=timezone.utc)
+    for idx in range(videos):
+      video_uuid = str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+      published_at += timedelta(hours=self.random.randint(1, 72))
+      self.videos.append({
+        'id': idx + 1,
+        'uuid': video_uuid,
+        'shortUUID': video_uuid.split('-')[0],
+        'name': f'Fake video {idx + 1:05d}',
+        'duration': self.random.randint(60, 3600),
+        'isLocal': True,
+        'isLive': False,
+        'nsfw': False,
+        'privacy': {'id': 1, 'label': 'Public'},
+        'createdAt': _iso(published_at),
+        'publishedAt': _iso(published_at),
+        'updatedAt': _iso(published_at)
+      })
+      self.videos_by_uuid[video_uuid] = self.videos[-1]
+      if self.random.random() < captioned_ratio:
+        self.captions[video_uuid] = [self._caption(video_uuid, published_at)]
+    for _ in range(active_jobs):
+      self._add_job(self.random.choice(self.videos)['uuid'] if self.videos else str(uuid.uuid4()), 2)
+
+  def _reset_stats(self):
+    self.stats = {
+      'requests': 0,
+      'by_status': Counter(),
+      'by_endpoint': Counter(),
+      'throttled': 0,
+      'injected_errors': 0,
+      'retries': 0,
+      'started_at': time.monotonic()
+    }
+    self.failed_requests = set()
+
+  def reset_stats(self):
+    with self.lock:
+      self._reset_stats()
+
+  def stats_snapshot(self):
+    with self.lock:
+      return {
+        'requests': self.stats['requests'],
+        'by_status': {str(status): count for status, count in sorted(self.stats['by_status'].items())},
+        'by_endpoint': dict(self.stats['by_endpoint'].most_common()),
+        'throttled': self.stats['throttled'],
+        'injected_errors': self.stats['injected_errors'],
+        'retries': self.stats['retries'],
+        'elapsed': time.monotonic() - self.stats['started_at']
+      }
+
+  def _caption(self, video_uuid, updated_at):
+    return {
+      'language': {'id': 'en', 'label': 'English'},
+      'automaticallyGenerated': True,
+      'captionPath': f'{CAPTION_PATH_PREFIX}{video_uuid}-en.vtt',
+      'updatedAt': _iso(updated_at)
+    }
+
+  def _add_job(self, video_uuid, state_id):
+    now = datetime.now(timezone.utc)
+    self.jobs.insert(0, {
+      'uuid': str(uuid.uuid4()),
+      'type': 'video-transcription',
+      'state': {'id': state_id, 'label': JOB_STATES[state_id]},
+      'runner': {'id': 1, 'name': 'fake-runner'} if state_id == 2 else None,
+      'privatePayload': {'videoUUID': video_uuid},
+      'createdAt': _iso(now),
+      'updatedAt': _iso(now)
+    })
+
+  def admit(self, method, endpoint, request_key):
+    """Record an incoming request and decide whether it is throttled (429) or fails (500), else `None`."""
+    now = time.monotonic()
+    with self.lock:
+      self.stats['requests'] += 1
+      self.stats['by_endpoint'][f'{method} {endpoint}'] += 1
+      if self.exempt_oauth and endpoint.startswith('oauth'):
+        return None
+      if request_key in self.failed_requests:
+        self.stats['retries'] += 1
+        self.failed_requests.discard(request_key)
+
+      status = None
+      if self.rate_limit:
+        while self.recent_requests and now - self.recent_requests[0] >= 1.0:
+          self.recent_requests.popleft()
+        if len(self.recent_requests) >= self.rate_limit:
+          self.stats['throttled'] += 1
+          status = 429
+        else:
+          self.recent_requests.append(now)
+      if status is None and self.error_rate and self.random.random() < self.error_rate:
+        self.stats['injected_errors'] += 1
+        status = 500
+      if status is not None:
+        self.failed_requests.add(request_key)
+      return status
+
+  def record_unknown(self, method):
+    """Record a request to an unknown route, without throttling, error injection or retry tracking."""
+    with self.lock:
+      self.stats['requests'] += 1
+      self.stats['by_endpoint'][f'{method} unknown'] += 1
+
+  def record_status(self, status):
+    with self.lock:
+      self.stats['by_status'][status] += 1
+
+  def list_videos(self, start, count):
+    with self.lock:
+      return {'total': len(self.videos), 'data': self.videos[start:start + count]}
+
+  def video_captions(self, video_uuid):
+    with self.lock:
+      if video_uuid not in self.videos_by_uuid:
+        return None
+      captions = self.captions.get(video_uuid, [])
+      return {'total': len(captions), 'data': captions}
+
+  def generate_captions(self, video_uuid):
+    with self.lock:
+      if video_uuid not in self.videos_by_uuid:
+        return 404
+      if any(job['privatePayload']['videoUUID'] == video_uuid and job['state']['id'] in (1, 2)
+             for job in self.jobs):
+        return 400
+      self._add_job(video_uuid, 1)
+      return 204
+
+  def list_jobs(self, start, count):
+    with self.lock:
+      return {'total': len(self.jobs), 'data': self.jobs[start:start + count]}
+
+  def caption_file(self, video_uuid):
+    with self.lock:
+      if video_uuid not in self.captions:
+        return None
+    return (f'WEBVTT\n\n'
+            f'00:00:00.000 --> 00:00:04.000\n'
+            f'Fake transcription for video {video_uuid}.\n\n'
+            f'00:00:04.000 --> 00:00:08.000\n'
+            f'Served by fake-peertube-server.py.\n')
+
+
+class FakePeerTubeHandler(BaseHTTPRequestHandler):
+  """Route PeerTube API requests to the `FakePeerTube` state attached to the server."""
+
+  protocol_version = 'HTTP/1.1'
+  server_version = 'FakePeerTube/1.0'
+  disable_nagle_algorithm = True
+
+  def log_message(self, format, *args):
+    if self.server.verbose:
+      super().log_message(format, *args)
+
+  def do_GET(self):
+    self._dispatch('GET')
+
+  def do_POST(self):
+    self._dispatch('POST')
+
+  def _dispatch(self, method):
+    url = urlsplit(self.path)
+    query = parse_qs(url.query)
+    length = int(self.headers.get('Content-Length') or 0)
+    body = self.rfile.read(length) if length else b''
+    parts = [part for part in url.path.split('/') if part]
+    fake = self.server.fake
+
+    # Control endpoints for the load harness, never throttled nor counted
+    if url.path == '/_fake/stats' and method == 'GET':
+      return self._send_json(200, fake.stats_snapshot(), count=False)
+    if url.path == '/_fake/reset' and method == 'POST':
+      fake.reset_stats()
+      return self._send_json(200, fake.stats_snapshot(), count=False)
+
+    endpoint = self._endpoint(method, parts)
+    if endpoint is None:
+      fake.record_unknown(method)
+      return self._send_json(404, {'error': f'Unknown route {method} {url.path}'})
+
+    failure = fake.admit(method, endpoint, (method, self.path))
+    if failure == 429:
+      return self._send_json(429, {'error': 'Too many requests, please try again later.'},
+                             headers={'Retry-After': '1'})
+    if failure == 500:
+      return self._send_json(500, {'error': 'Injected server error.'})
+    # Like a rate limiter in front of the application, rejected requests are answered right away
+    if fake.latency:
+      time.sleep(fake.latency)
+
+    if endpoint != 'caption file' and not endpoint.startswith('oauth') and \
+       not self.headers.get('Authorization', '').startswith('Bearer '):
+      return self._send_json(401, {'error': 'Authentication is required.'})
+
+    if endpoint in ('videos', 'runner jobs'):
+      pagination = self._pagination(query)
+      if pagination is None:
+        return self._send_json(400, {'error': 'Incorrect request parameters: start, count'})
+      start, count = pagination
+    if endpoint == 'videos':
+      return self._send_json(200, fake.list_videos(start, count))
+    if endpoint == 'video captions':
+      captions = fake.video_captions(parts[3])
+      if captions is None:
+        return self._send_json(404, {'error': 'Video not found.'})
+      return self._send_json(200, captions)
+    if endpoint == 'generate captions':
+      status = fake.generate_captions(parts[3])
+      if status == 204:
+        return self._send(204, b'', 'application/json')
+      return self._send_json(status, {'error': f'Cannot generate captions for video {parts[3]}.'})
+    if endpoint == 'runner jobs':
+      return self._send_json(200, fake.list_jobs(start, count))
+    if endpoint == 'oauth client':
+      return self._send_json(200, {'client_id': 'fake-client-id', 'client_secret': 'fake-client-secret'})
+    if endpoint == 'oauth token':
+      form = parse_qs(body.decode('utf-8'))
+      if not form.get('username') or not form.get('password'):
+        return self._send_json(400, {'error': 'Missing username or password.'})
+      return self._send_json(200, {
+        'token_type': 'Bearer',
+        'access_token': f'fake-access-{uuid.uuid4().hex}',
+        'refresh_token': f'fake-refresh-{uuid.uuid4().hex}',
+        'expires_in': 86399,
+        'refresh_token_expires_in': 1209599
+      })
+    if endpoint == 'caption file':
+      caption_text = fake.caption_file(parts[-1][:-len('-en.vtt')])
+      if caption_text is None:
+        return self._send_json(404, {'error': 'Caption file not found.'})
+      return self._send(200, caption_text.encode('utf-8'), 'text/vtt; charset=utf-8')
+
+  @staticmethod
+  def _pagination(query):
+    """Parse the `start` and `count` query parameters, `None` if they are not non-negative integers."""
+    try:
+      start, count = int(query.get('start', ['0'])[0]), int(query.get('count', ['15'])[0])
+    except ValueError:
+      return None
+    if start < 0 or count < 0:
+      return None
+    return start, min(count, 100)
+
+  @staticmethod
+  def _endpoint(method, parts):
+    """Map a request to a short endpoint name used for routing and statistics."""
+    if method == 'GET' and parts == ['api', 'v1', 'videos']:
+      return 'videos'
+    if method == 'GET' and len(parts) == 5 and parts[:3] == ['api', 'v1', 'videos'] and parts[4] == 'captions':
+      return 'video captions'
+    if method == 'POST' and len(parts) == 6 and parts[:3] == ['api', 'v1', 'videos'] and \
+       parts[4:] == ['captions', 'generate']:
+      return 'generate captions'
+    if method == 'GET' and parts == ['api', 'v1', 'runners', 'jobs']:
+      return 'runner jobs'
+    if method == 'GET' and parts == ['api', 'v1', 'oauth-clients', 'local']:
+      return 'oauth client'
+    if method == 'POST' and parts == ['api', 'v1', 'users', 'token']:
+      return 'oauth token'
+    if method == 'GET' and '/' + '/'.join(parts[:-1]) + '/' == CAPTION_PATH_PREFIX and parts[-1].endswith('-en.vtt'):
+      return 'caption file'
+    return None
+
+  def _send_json(self, status, data, headers=None, count=True):
+    self._send(status, json.dumps(data).encode('utf-8'), 'application/json; charset=utf-8', headers, count)
+
+  def _send(self, status, body, content_type, headers=None, count=True):
+    if count:
+      self.server.fake.record_status(status)
+    self.send_response(status)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(body)))
+    for name, value in (headers or {}).items():
+      self.send_header(name, value)
+    self.end_headers()
+    self.wfile.write(body)
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True, help='Interface to listen on.')
+@click.option('--port', default=8443, show_default=True, help='Port to listen on.')
+@click.option('--videos', default=500, show_default=True, help='Number of videos in the fake catalogue.')
+@click.option('--captioned-ratio', default=0.5, show_default=True, help='Share of videos that already have captions.')
+@click.option('--active-jobs', default=2, show_default=True, help='Number of runner jobs already processing.')
+@click.option('--latency', default=0.0, show_default=True,
+              help='Added latency per API request not answered with HTTP 429 or 500, in seconds.')
+@click.option('--error-rate', default=0.0, show_default=True, help='Share of API requests failing with HTTP 500.')
+@click.option('--rate-limit', default=0, show_default=True,
+              help='Max API requests per second before answering HTTP 429, 0 to disable.')
+@click.option('--seed', default=0, show_default=True, help='Random seed for the catalogue and error injection.')
+@click.option('--exempt-oauth', is_flag=True, help='Never throttle nor fail the OAuth client and token endpoints.')
+@click.option('--certfile', default=None, help='TLS certificate (PEM) to serve HTTPS, like a real PeerTube site.')
+@click.option('--keyfile', default=None, help='TLS private key (PEM) matching the certificate.')
+@click.option('--verbose', is_flag=True, help='Log every request.')
+def fake_peertube_server(host, port, videos, captioned_ratio, active_jobs, latency, error_rate, rate_limit, seed,
+                         exempt_oauth, certfile, keyfile, verbose):
+  """Serve a local stand-in for the PeerTube API endpoints used by the utility scripts."""
+
+  server = ThreadingHTTPServer((host, port), FakePeerTubeHandler)
+  server.daemon_threads = True
+  server.verbose = verbose
+  server.fake = FakePeerTube(videos, captioned_ratio, active_jobs, latency, error_rate, rate_limit, seed,
+                             exempt_oauth)
+  scheme = 'http'
+  if certfile:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    scheme = 'https'
+  click.echo(click.style(f"Fake PeerTube serving {len(server.fake.videos)} videos "
+                         f"({len(server.fake.captions)} with captions) on {scheme}://{host}:{port}", fg='green'),
+             err=True)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+
+
+if __name__ == '__main__':
+  fake_peertube_server()